@@ -1,13 +1,30 @@
+import gzip
+import hashlib
 import io
 import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import zipfile
+import httplib2
 import pandas as pd
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict, List
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
 from pydantic import BaseModel, Field, validator
+from google_auth_httplib2 import AuthorizedHttp
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest, MediaIoBaseDownload
 
 # --------------------------------
 # Config Streamlit
@@ -23,6 +40,15 @@ SCOPES = [
 # --------------------------------
 # Classe de configuração
 # --------------------------------
+@lru_cache(maxsize=256)
+def _normalize_key(k: str) -> str:
+    key = k.strip()
+    if not key.startswith("{{"):
+        key = "{{" + key
+    if not key.endswith("}}"):
+        key = key + "}}"
+    return key
+
 class DocRunConfig(BaseModel):
     template_doc_id: str
     output_folder_id: str
@@ -31,32 +57,125 @@ class DocRunConfig(BaseModel):
 
     @validator("placeholders")
     def normalize_keys(cls, v: Dict[str, str]):
-        fixed = {}
-        for k, val in v.items():
-            key = k.strip()
-            if not key.startswith("{{"):
-                key = "{{" + key
-            if not key.endswith("}}"):
-                key = key + "}}"
-            fixed[key] = str(val)
-        return fixed
+        return {_normalize_key(k): str(val) for k, val in v.items()}
+
+# Versão sem validação Pydantic, usada por linha no modo em lote;
+# as chaves já chegam normalizadas (ver normalize_columns)
+@dataclass(frozen=True, slots=True)
+class DocRunConfigFast:
+    template_doc_id: str
+    output_folder_id: str
+    document_title: str
+    placeholders: Dict[str, str] = field(default_factory=dict)
 
 # --------------------------------
 # Autenticação Google
 # --------------------------------
+# Todas as threads do lote compartilham as mesmas credenciais: a renovação do
+# token (antes de expirar ou após um 401) passa por um único lock, e quem
+# esperou por ele reaproveita o token que a outra thread acabou de obter
+class SharedCredentials(Credentials):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self, request):
+        stale_token = self.token
+        with self._refresh_lock:
+            if self.token != stale_token and self.valid:
+                return
+            super().refresh(request)
+
+def service_account_key(sa_info: dict) -> str:
+    return hashlib.sha256(json.dumps(sa_info, sort_keys=True).encode()).hexdigest()
+
 @st.cache_resource
-def get_google_clients(sa_info: dict):
-    creds = Credentials.from_service_account_info(sa_info, scopes=SCOPES)
-    docs = build("docs", "v1", credentials=creds, cache_discovery=False)
-    drive = build("drive", "v3", credentials=creds, cache_discovery=False)
-    return docs, drive
+def get_credentials(sa_key: str, _sa_info: dict):
+    # Cache por processo, indexado pelo hash do JSON do Service Account. O
+    # token só é pedido na primeira chamada à API, dentro do tratamento de erro
+    return SharedCredentials.from_service_account_info(_sa_info, scopes=SCOPES)
+
+HTTP_TIMEOUT = 60
+# Uma requisição batch leva até BATCH_LIMIT chamadas (ex.: 100 files.copy) e
+# pode passar bem de HTTP_TIMEOUT: ganha um Http próprio, com prazo maior
+BATCH_HTTP_TIMEOUT = 300
+
+def _authorized_http(creds, timeout: int = HTTP_TIMEOUT) -> AuthorizedHttp:
+    # Um Http por cliente: o httplib2 mantém a conexão aberta (keep-alive) entre chamadas
+    return AuthorizedHttp(creds, http=httplib2.Http(timeout=timeout))
+
+# Corpos maiores que isso (ex.: batchUpdate com textos longos) seguem comprimidos
+GZIP_MIN_BODY = 1024
+
+class GzipHttpRequest(HttpRequest):
+    # A compressão acontece só no execute(): requisições adicionadas a um
+    # batch HTTP são serializadas a partir do corpo original
+    def execute(self, http=None, num_retries=0):
+        if self.body is not None and len(self.body) > GZIP_MIN_BODY and "content-encoding" not in self.headers:
+            body = self.body.encode("utf-8") if isinstance(self.body, str) else self.body
+            self.body = gzip.compress(body)
+            self.body_size = len(self.body)
+            self.headers["content-encoding"] = "gzip"
+        return super().execute(http=http, num_retries=num_retries)
+
+@st.cache_resource
+def get_google_clients(sa_key: str, _sa_info: dict):
+    creds = get_credentials(sa_key, _sa_info)
+    docs = build("docs", "v1", http=_authorized_http(creds), cache_discovery=False,
+                 requestBuilder=GzipHttpRequest)
+    drive = build("drive", "v3", http=_authorized_http(creds), cache_discovery=False)
+    return creds, docs, drive
+
+# O transporte HTTP do googleapiclient não é thread-safe:
+# cada thread usa os seus próprios clientes do Docs/Drive
+_thread_clients = threading.local()
+
+def _thread_client(creds, service: str, version: str):
+    cached = getattr(_thread_clients, service, None)
+    if cached is None or cached[0] is not creds:
+        cached = (creds, build(service, version, http=_authorized_http(creds), cache_discovery=False))
+        setattr(_thread_clients, service, cached)
+    return cached[1]
+
+def _thread_drive(creds):
+    return _thread_client(creds, "drive", "v3")
+
+# --------------------------------
+# Retentativas (429 / 5xx)
+# --------------------------------
+MAX_ATTEMPTS = 6
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+def _is_retryable(error: Optional[Exception]) -> bool:
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status in RETRYABLE_STATUS:
+        return True
+    # O Drive sinaliza cota excedida (userRateLimitExceeded) também com 403
+    return error.resp.status == 403 and b"ratelimitexceeded" in (error.content or b"").lower()
+
+def _retry_delay(error: HttpError, attempt: int) -> float:
+    try:
+        retry_after = float(error.resp.get("retry-after", 0))
+    except (TypeError, ValueError):
+        retry_after = 0
+    return max(retry_after, 2 ** attempt + random.uniform(0, 1))
+
+def _with_retry(call, *, max_attempts: int = MAX_ATTEMPTS):
+    for attempt in range(max_attempts):
+        try:
+            return call()
+        except HttpError as e:
+            if attempt == max_attempts - 1 or not _is_retryable(e):
+                raise
+            time.sleep(_retry_delay(e, attempt))
 
 def copy_template_to_folder(drive, template_id: str, new_title: str, folder_id: str) -> str:
     file_metadata = {"name": new_title, "parents": [folder_id]}
-    copied = drive.files().copy(fileId=template_id, body=file_metadata).execute()
+    copied = _with_retry(drive.files().copy(fileId=template_id, body=file_metadata).execute)
     return copied["id"]
 
-def replace_all_text(docs, document_id: str, mapping: Dict[str, str]):
+def _replace_requests(mapping: Dict[str, str]) -> List[dict]:
     requests = []
     for key, value in mapping.items():
         requests.append({
@@ -65,31 +184,212 @@ def replace_all_text(docs, document_id: str, mapping: Dict[str, str]):
                 "replaceText": value,
             }
         })
+    return requests
+
+def replace_all_text(docs, document_id: str, mapping: Dict[str, str]):
+    requests = _replace_requests(mapping)
     if requests:
-        docs.documents().batchUpdate(documentId=document_id, body={"requests": requests}).execute()
+        _with_retry(docs.documents().batchUpdate(documentId=document_id, body={"requests": requests}).execute)
+
+# --------------------------------
+# Requisições em lote (batch HTTP)
+# --------------------------------
+# Limite de chamadas por requisição batch da API do Drive
+BATCH_LIMIT = 100
+
+def _execute_batched(service, calls: Dict[int, object], http) -> Dict[int, Tuple[Optional[dict], Optional[Exception]]]:
+    results = {}
+
+    def on_done(request_id, response, exception):
+        results[int(request_id)] = (response, exception)
+
+    pending = list(calls.items())
+    for attempt in range(MAX_ATTEMPTS):
+        for start in range(0, len(pending), BATCH_LIMIT):
+            chunk = pending[start:start + BATCH_LIMIT]
+            batch = service.new_batch_http_request(callback=on_done)
+            for i, call in chunk:
+                batch.add(call, request_id=str(i))
+            try:
+                batch.execute(http=http)
+            except Exception as e:
+                # Falha do batch inteiro (rede, timeout, BatchError, HttpError):
+                # só as linhas deste chunk ficam com erro. Um 429/5xx volta no
+                # laço abaixo, junto com as chamadas que falharam sozinhas
+                for i, _ in chunk:
+                    results[i] = (None, e)
 
-def export_pdf(drive, document_id: str) -> bytes:
+        # Chamadas que bateram na cota (ou em erro 5xx), sozinhas ou com o batch
+        # inteiro, voltam num novo batch: é a única camada de retentativa aqui
+        pending = [(i, call) for i, call in pending if _is_retryable(results[i][1])]
+        if not pending or attempt == MAX_ATTEMPTS - 1:
+            break
+        time.sleep(max(_retry_delay(results[i][1], attempt) for i, _ in pending))
+    return results
+
+def batch_copy_templates(drive, cfgs: Dict[int, DocRunConfigFast], http) -> Dict[int, Tuple[Optional[str], Optional[Exception]]]:
+    calls = {
+        i: drive.files().copy(
+            fileId=cfg.template_doc_id,
+            body={"name": cfg.document_title, "parents": [cfg.output_folder_id]},
+        )
+        for i, cfg in cfgs.items()
+    }
+    return {
+        i: (response["id"] if exception is None else None, exception)
+        for i, (response, exception) in _execute_batched(drive, calls, http).items()
+    }
+
+def batch_replace_all_text(docs, targets: Dict[int, Tuple[str, Dict[str, str]]], http) -> Dict[int, Optional[Exception]]:
+    calls = {}
+    for i, (document_id, mapping) in targets.items():
+        requests = _replace_requests(mapping)
+        if requests:
+            calls[i] = docs.documents().batchUpdate(documentId=document_id, body={"requests": requests})
+    return {i: exception for i, (_, exception) in _execute_batched(docs, calls, http).items()}
+
+# Chunk padrão do MediaIoBaseDownload (100 MiB): uma exportação de MOU cabe
+# numa única requisição
+def export_pdf(drive, document_id: str, out: BinaryIO):
     request = drive.files().export(fileId=document_id, mimeType="application/pdf")
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)
+    downloader = MediaIoBaseDownload(out, request)
     done = False
     while not done:
-        status, done = downloader.next_chunk()
-    fh.seek(0)
-    return fh.read()
+        status, done = _with_retry(downloader.next_chunk)
 
-def export_docx(drive, document_id: str) -> bytes:
+def export_docx(drive, document_id: str, out: BinaryIO):
     request = drive.files().export(
         fileId=document_id,
         mimeType="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
     )
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)
+    downloader = MediaIoBaseDownload(out, request)
     done = False
     while not done:
-        status, done = downloader.next_chunk()
-    fh.seek(0)
-    return fh.read()
+        status, done = _with_retry(downloader.next_chunk)
+
+# --------------------------------
+# PDF local (LibreOffice)
+# --------------------------------
+@lru_cache(maxsize=None)
+def _soffice() -> Optional[str]:
+    return shutil.which("soffice")
+
+def docx_to_pdf(docx_in: BinaryIO, pdf_out: BinaryIO) -> bool:
+    with tempfile.TemporaryDirectory() as td:
+        docx_path = os.path.join(td, "file.docx")
+        pdf_path = os.path.join(td, "file.pdf")
+
+        with open(docx_path, "wb") as f:
+            shutil.copyfileobj(docx_in, f)
+
+        try:
+            subprocess.run(
+                [
+                    "soffice",
+                    # Perfil próprio por conversão: permite várias instâncias em paralelo
+                    f"-env:UserInstallation={Path(td, 'profile').as_uri()}",
+                    "--headless",
+                    "--convert-to",
+                    "pdf",
+                    "--outdir",
+                    td,
+                    docx_path,
+                ],
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            with open(pdf_path, "rb") as f:
+                shutil.copyfileobj(f, pdf_out)
+            return True
+        except Exception:
+            return False
+
+def export_documents(creds, document_id: str, pdf_out: BinaryIO, docx_out: BinaryIO):
+    # Exporta só o DOCX do Drive e gera o PDF localmente (se a conversão
+    # falhar, o PDF também vem do Drive). Sem LibreOffice, ver iter_exports
+    export_docx(_thread_drive(creds), document_id, docx_out)
+    docx_out.seek(0)
+    if not docx_to_pdf(docx_out, pdf_out):
+        export_pdf(_thread_drive(creds), document_id, pdf_out)
+
+def _to_tempfiles(export, creds, document_id: str, count: int) -> Tuple[BinaryIO, ...]:
+    outs = tuple(tempfile.TemporaryFile() for _ in range(count))
+    try:
+        export(creds, document_id, *outs)
+    except Exception:
+        for out in outs:
+            out.close()
+        raise
+    return outs
+
+def _export_pdf(creds, document_id: str, pdf_out: BinaryIO):
+    export_pdf(_thread_drive(creds), document_id, pdf_out)
+
+def _export_docx(creds, document_id: str, docx_out: BinaryIO):
+    export_docx(_thread_drive(creds), document_id, docx_out)
+
+def iter_exports(creds, doc_ids: Dict[int, str], max_workers: int) \
+        -> Iterator[Tuple[int, Optional[Tuple[BinaryIO, BinaryIO]], Optional[Exception]]]:
+    # Entrega cada exportação assim que termina, na ordem de conclusão. Sem
+    # LibreOffice, PDF e DOCX viram duas tarefas independentes neste mesmo
+    # pool: cada thread reaproveita o seu cliente do Drive (e a conexão)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for i, new_doc_id in doc_ids.items():
+            if _soffice() is not None:
+                futures[executor.submit(_to_tempfiles, export_documents, creds, new_doc_id, 2)] = (i, None)
+            else:
+                futures[executor.submit(_to_tempfiles, _export_pdf, creds, new_doc_id, 1)] = (i, "pdf")
+                futures[executor.submit(_to_tempfiles, _export_docx, creds, new_doc_id, 1)] = (i, "docx")
+
+        halves: Dict[int, Dict[str, Tuple[Optional[BinaryIO], Optional[Exception]]]] = {}
+        for future in as_completed(futures):
+            i, kind = futures[future]
+            try:
+                exported, error = future.result(), None
+            except Exception as e:
+                exported, error = None, e
+            if kind is None:
+                yield i, exported, error
+                continue
+
+            # Exportações separadas: o documento sai quando as duas terminam
+            done = halves.setdefault(i, {})
+            done[kind] = (exported[0] if exported else None, error)
+            if len(done) < 2:
+                continue
+            del halves[i]
+            error = done["pdf"][1] or done["docx"][1]
+            if error is not None:
+                for out, _ in done.values():
+                    if out is not None:
+                        out.close()
+                yield i, None, error
+            else:
+                yield i, (done["pdf"][0], done["docx"][0]), None
+
+@st.cache_data(show_spinner=False)
+def load_csv(file_bytes: bytes) -> pd.DataFrame:
+    return pd.read_csv(io.BytesIO(file_bytes))
+
+def render_key(cfg: DocRunConfigFast) -> str:
+    payload = cfg.template_doc_id + "|" + json.dumps(cfg.placeholders, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def normalize_columns(columns) -> Dict[str, str]:
+    return {c: _normalize_key(c) for c in columns}
+
+def build_row_config(rec: Dict[str, Optional[str]], norm_cols: Dict[str, str], template_doc_id: str,
+                     output_folder_id: str, today_str: str) -> DocRunConfigFast:
+    placeholders = {norm_cols[k]: v for k, v in rec.items() if v is not None}
+    title = rec.get("TITLE") or f"MOU – {rec.get('GROUP_NAME') or 'Sem Nome'} – {today_str}"
+    return DocRunConfigFast(
+        template_doc_id=template_doc_id.strip(),
+        output_folder_id=output_folder_id.strip(),
+        document_title=title,
+        placeholders=placeholders,
+    )
 
 # --------------------------------
 # UI – Sidebar
@@ -115,7 +415,7 @@ if sa_info is None:
     st.warning("Envie as credenciais na barra lateral para continuar.")
     st.stop()
 
-docs, drive = get_google_clients(sa_info)
+creds, docs, drive = get_google_clients(service_account_key(sa_info), sa_info)
 
 # --------------------------------
 # Placeholders padrão
@@ -175,9 +475,15 @@ if not batch_mode:
             new_doc_id = copy_template_to_folder(drive, cfg.template_doc_id, cfg.document_title, cfg.output_folder_id)
             replace_all_text(docs, new_doc_id, cfg.placeholders)
 
-            # Exportar
-            pdf_bytes = export_pdf(drive, new_doc_id)
-            docx_bytes = export_docx(drive, new_doc_id)
+            # Exportar: mesmo caminho do lote (PDF e DOCX em paralelo sem o LibreOffice)
+            [(_, exported, error)] = iter_exports(creds, {0: new_doc_id}, max_workers=2)
+            if error is not None:
+                raise error
+            pdf_out, docx_out = exported
+            with pdf_out, docx_out:
+                pdf_out.seek(0)
+                docx_out.seek(0)
+                pdf_bytes, docx_bytes = pdf_out.read(), docx_out.read()
 
             st.success("Documento gerado!")
             doc_link = f"https://docs.google.com/document/d/{new_doc_id}/edit"
@@ -198,34 +504,87 @@ else:
     template_doc_id = st.text_input("ID do Google Docs TEMPLATE")
     output_folder_id = st.text_input("ID da pasta de destino (Drive)")
     csv_file = st.file_uploader("CSV de dados", type=["csv"])
+    max_workers = st.slider("Documentos em paralelo", min_value=1, max_value=8, value=4,
+                            help="Limitado pela cota de escrita do Drive por usuário")
 
     if csv_file is not None and st.button("Gerar documentos em lote", type="primary"):
-        df = pd.read_csv(csv_file)
-        results: List[Dict[str, str]] = []
-        zip_buffer = io.BytesIO()
-        import zipfile
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-            for _, row in df.iterrows():
-                placeholders = {k: str(row[k]) for k in df.columns if pd.notna(row[k])}
-                title = row.get("TITLE", f"MOU – {placeholders.get('GROUP_NAME','Sem Nome')} – {datetime.now().strftime('%Y-%m-%d')}")
-                cfg = DocRunConfig(
-                    template_doc_id=template_doc_id.strip(),
-                    output_folder_id=output_folder_id.strip(),
-                    document_title=str(title),
-                    placeholders=placeholders,
-                )
-                try:
-                    new_doc_id = copy_template_to_folder(drive, cfg.template_doc_id, cfg.document_title, cfg.output_folder_id)
-                    replace_all_text(docs, new_doc_id, cfg.placeholders)
-                    pdf_bytes = export_pdf(drive, new_doc_id)
-                    docx_bytes = export_docx(drive, new_doc_id)
-                    zf.writestr(f"{cfg.document_title}.pdf", pdf_bytes)
-                    zf.writestr(f"{cfg.document_title}.docx", docx_bytes)
-                    results.append({"title": cfg.document_title, "status": "OK"})
-                except Exception as e:
-                    results.append({"title": cfg.document_title, "status": f"ERRO: {e}"})
-
-        st.success("Processo concluído!")
-        st.dataframe(results)
-        zip_buffer.seek(0)
-        st.download_button("⬇️ Baixar todos (.zip)", data=zip_buffer, file_name="mous_gerados.zip", mime="application/zip")
+        df = load_csv(csv_file.getvalue())
+        # Conversão para texto feita uma única vez, por coluna; células vazias viram None
+        records = df.astype("string").astype(object).where(df.notna(), None).to_dict(orient="records")
+        norm_cols = normalize_columns(df.columns)
+        today_str = datetime.now().strftime('%Y-%m-%d')
+        cfgs = [build_row_config(rec, norm_cols, template_doc_id, output_folder_id, today_str) for rec in records]
+        results: List[Dict[str, str]] = [{"title": cfg.document_title, "status": "PENDENTE"} for cfg in cfgs]
+        progress = st.progress(0.0, text="Copiando templates...")
+        table = st.empty()
+
+        # Linhas com o mesmo template e os mesmos placeholders geram um único documento,
+        # reaproveitado para todas as linhas repetidas
+        same_render: Dict[int, List[int]] = {}
+        first_by_key: Dict[str, int] = {}
+        for i, cfg in enumerate(cfgs):
+            first = first_by_key.setdefault(render_key(cfg), i)
+            same_render.setdefault(first, []).append(i)
+
+        # Cópias e substituições agrupadas em requisições batch (até 100 chamadas cada)
+        doc_ids: Dict[int, str] = {}
+        batch_http = _authorized_http(creds, BATCH_HTTP_TIMEOUT)
+        copied = batch_copy_templates(drive, {i: cfgs[i] for i in same_render}, batch_http)
+        for i, (new_doc_id, error) in copied.items():
+            if error is None:
+                doc_ids[i] = new_doc_id
+            else:
+                for j in same_render[i]:
+                    results[j]["status"] = f"ERRO: {error}"
+
+        replaced = batch_replace_all_text(docs, {i: (doc_ids[i], cfgs[i].placeholders) for i in doc_ids}, batch_http)
+        for i, error in replaced.items():
+            if error is not None:
+                for j in same_render[i]:
+                    results[j]["status"] = f"ERRO: {error}"
+                del doc_ids[i]
+
+        total = max(len(cfgs), 1)
+        done = sum(len(same_render[i]) for i in same_render if i not in doc_ids)
+        progress.progress(done / total, text="Exportando documentos...")
+        table.dataframe(results)
+
+        # Exportações (download de mídia) não entram em batch: rodam em paralelo
+        # ZIP gravado em arquivo temporário em vez de acumular tudo em memória
+        with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as tmp:
+            zip_path = tmp.name
+        try:
+            with zipfile.ZipFile(zip_path, "w") as zf:
+                # ZipFile não é thread-safe: grava somente a partir da thread principal
+                for i, exported, error in iter_exports(creds, doc_ids, max_workers):
+                    if error is not None:
+                        for j in same_render[i]:
+                            results[j]["status"] = f"ERRO: {error}"
+                    else:
+                        pdf_out, docx_out = exported
+                        with pdf_out, docx_out:
+                            for j in same_render[i]:
+                                # PDF e DOCX já vêm comprimidos (o DOCX é um zip): armazena
+                                # os dois sem recomprimir
+                                for name, exported_file in (
+                                    (f"{cfgs[j].document_title}.pdf", pdf_out),
+                                    (f"{cfgs[j].document_title}.docx", docx_out),
+                                ):
+                                    info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                                    info.compress_type = zipfile.ZIP_STORED
+                                    exported_file.seek(0)
+                                    with zf.open(info, "w", force_zip64=True) as entry:
+                                        shutil.copyfileobj(exported_file, entry)
+                                results[j]["status"] = "OK"
+
+                    done += len(same_render[i])
+                    progress.progress(done / total, text=f"Exportando documentos... {done}/{len(cfgs)}")
+                    table.dataframe(results)
+
+            progress.progress(1.0, text="Processo concluído!")
+            st.success("Processo concluído!")
+            with open(zip_path, "rb") as zip_file:
+                st.download_button("⬇️ Baixar todos (.zip)", data=zip_file, file_name="mous_gerados.zip", mime="application/zip")
+        finally:
+            # Também em erro, st.stop ou rerun: o ZIP não fica no disco do servidor
+            os.remove(zip_path)
@@ -1,202 +1,85 @@
-import io
+import hashlib
+import multiprocessing
 import os
-import re
+import sys
 import zipfile
 import tempfile
-import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, Set
+from typing import Dict
 
 import pandas as pd
 import streamlit as st
-from docx import Document
-from docx.shared import Pt
-from pydantic import BaseModel, Field, validator
-
-st.set_page_config(page_title="Gerador de MOU", page_icon="📝", layout="wide")
-
-PLACEHOLDER_RE = re.compile(r"\{\{([A-Z0-9_]+)\}\}", re.IGNORECASE)
-
-# ---------------------------
-# DOCX utils
-# ---------------------------
-def _iter_all_paragraphs(doc: Document):
-    for p in doc.paragraphs:
-        yield p
-
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    yield p
-
-    for section in doc.sections:
-        for p in section.header.paragraphs:
-            yield p
-        for p in section.footer.paragraphs:
-            yield p
-
-
-def _para_text(p) -> str:
-    txt = "".join(run.text for run in p.runs) or p.text or ""
-    return re.sub(r"\s+", " ", txt).strip()
-
-
-def extract_placeholders(doc: Document) -> Set[str]:
-    found = set()
-    for p in _iter_all_paragraphs(doc):
-        for m in PLACEHOLDER_RE.finditer(_para_text(p)):
-            found.add(m.group(1).strip().upper())
-    return found
 
+from mourender import (
+    bake_default_formatting,
+    convert_pdf,
+    convert_pdfs,
+    extract_placeholders_fast,
+    init_worker,
+    normalize_mapping,
+    render_one,
+    render_row,
+)
 
-# ---------------------------
-# Exceções de negrito
-# ---------------------------
-def is_exception(text: str) -> bool:
-    t = text.lower().strip()
-
-    if "{{bp_date}}" in t or "{{comments}}" in t or "{{comments_eng}}" in t:
-        return True
-
-    if "como parte integrante deste documento" in t:
-        return True
-
-    if "as an integral part of this document" in t:
-        return True
-
-    if "business plan" in t:
-        return True
-
-    if "arquivo:" in t or "file:" in t:
-        return True
-
-    if "especifica" in t or "specification" in t:
-        return True
-
-    if re.fullmatch(r"n\s*/?\s*a\.?", t):
-        return True
-
-    return False
+st.set_page_config(page_title="Gerador de MOU", page_icon="📝", layout="wide")
 
 
 # ---------------------------
-# Replace placeholders
+# Template
 # ---------------------------
-def replace_doc(doc: Document, mapping: Dict[str, str]):
-    exceptions = set()
-
-    normalized_mapping = {
-        k.strip().strip("{} ").upper(): "" if pd.isna(v) else str(v)
-        for k, v in mapping.items()
-    }
+@st.cache_data(show_spinner=False)
+def prepare_template(template_bytes: bytes) -> bytes:
+    return bake_default_formatting(template_bytes)
 
-    for p in _iter_all_paragraphs(doc):
-        original = _para_text(p)
 
-        if is_exception(original):
-            exceptions.add(p)
-
-        replaced = original
-        for k, v in normalized_mapping.items():
-            pattern = re.compile(r"\{\{" + re.escape(k) + r"\}\}", re.IGNORECASE)
-            replaced = pattern.sub(v, replaced)
-
-        if replaced != original:
-            for _ in range(len(p.runs)):
-                p._element.remove(p.runs[0]._element)
-            p.add_run(replaced)
-
-    return exceptions
+@st.cache_data(show_spinner=False)
+def template_fields(template_bytes: bytes) -> list:
+    # Lê os placeholders direto do XML do template, sem abrir o Document
+    return sorted(extract_placeholders_fast(template_bytes))
 
 
 # ---------------------------
-# Formatação
+# Processos do lote
 # ---------------------------
-def format_doc(doc: Document, exceptions: Set):
-    paragraphs = list(_iter_all_paragraphs(doc))
-
-    # Calibri 11 + negrito em tudo
-    for p in paragraphs:
-        for r in p.runs:
-            r.font.name = "Calibri"
-            r.font.size = Pt(11)
-            r.bold = True
-
-    # Remove negrito das exceções
-    for i, p in enumerate(paragraphs):
-        text = _para_text(p).lower().strip()
-
-        if p in exceptions or is_exception(text):
-            for r in p.runs:
-                r.bold = False
+# Teto de processos: os.cpu_count() enxerga todas as CPUs da máquina, não o
+# limite do contêiner; a afinidade do processo é uma estimativa melhor
+MAX_RENDER_WORKERS = 4
 
-        # Caso o "2." esteja separado da frase
-        if text in ["2.", "2"]:
-            for r in p.runs:
-                r.bold = False
 
-            if i + 1 < len(paragraphs):
-                next_text = _para_text(paragraphs[i + 1]).lower()
-                if is_exception(next_text):
-                    for r in paragraphs[i + 1].runs:
-                        r.bold = False
+def render_workers(jobs: int) -> int:
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    return max(1, min(cpus, MAX_RENDER_WORKERS, jobs))
 
 
-# ---------------------------
-# PDF
-# ---------------------------
-def convert_pdf(docx_bytes: bytes):
-    with tempfile.TemporaryDirectory() as td:
-        docx_path = os.path.join(td, "file.docx")
-        pdf_path = os.path.join(td, "file.pdf")
-
-        with open(docx_path, "wb") as f:
-            f.write(docx_bytes)
-
-        try:
-            from docx2pdf import convert
-            convert(docx_path, pdf_path)
-            with open(pdf_path, "rb") as f:
-                return f.read()
-        except Exception:
-            pass
-
-        try:
-            subprocess.run(
-                [
-                    "soffice",
-                    "--headless",
-                    "--convert-to",
-                    "pdf",
-                    "--outdir",
-                    td,
-                    docx_path,
-                ],
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
-            with open(pdf_path, "rb") as f:
-                return f.read()
-        except Exception:
-            return None
+# Os processos do lote usam "spawn" em todas as plataformas: fazer fork do
+# servidor do Streamlit, que tem várias threads, pode travar. No Streamlit o
+# __main__ é um módulo falso com o __file__ deste script, e um filho por
+# "spawn" reexecutaria esse arquivo, ou seja, a UI inteira, e quebraria fora
+# do contexto do Streamlit. Por isso o __file__ fica oculto enquanto os
+# processos sobem, e eles só importam o mourender
+@contextmanager
+def main_file_hidden():
+    main = sys.modules["__main__"]
+    path = main.__dict__.pop("__file__", None)
+    try:
+        yield
+    finally:
+        if path is not None:
+            main.__file__ = path
 
 
 # ---------------------------
 # Validação
 # ---------------------------
-class JobConfig(BaseModel):
+# As chaves são normalizadas por normalize_mapping antes de montar o JobConfig,
+# sem o validator do Pydantic a cada geração
+@dataclass(frozen=True, slots=True)
+class JobConfig:
     title: str
-    placeholders: Dict[str, str] = Field(default_factory=dict)
-
-    @validator("placeholders")
-    def normalize_keys(cls, v: Dict[str, str]):
-        fixed = {}
-        for k, val in v.items():
-            key = k.strip().strip("{} ").upper()
-            fixed[key] = "" if pd.isna(val) else str(val)
-        return fixed
+    placeholders: Dict[str, str]
 
 
 # ---------------------------
@@ -214,9 +97,17 @@ if not template_file:
     st.info("Envie o template DOCX para começar.")
     st.stop()
 
-template_bytes = template_file.read()
-doc_template = Document(io.BytesIO(template_bytes))
-fields = sorted(list(extract_placeholders(doc_template)))
+# O script roda de novo a cada interação: o template preparado e a lista de
+# campos ficam na sessão, e só um upload diferente refaz o trabalho
+raw_template = template_file.getvalue()
+template_hash = hashlib.blake2b(raw_template, digest_size=16).hexdigest()
+if st.session_state.get("tpl_hash") != template_hash:
+    st.session_state.tpl_bytes = prepare_template(raw_template)
+    st.session_state.tpl_fields = template_fields(st.session_state.tpl_bytes)
+    st.session_state.tpl_hash = template_hash
+
+template_bytes = st.session_state.tpl_bytes
+fields = st.session_state.tpl_fields
 
 if not fields:
     st.warning("Nenhum placeholder encontrado. Use o formato {{CHAVE}} no template.")
@@ -239,15 +130,11 @@ if not batch_mode:
     title = st.text_input("Nome do arquivo", value=default_title)
 
     if st.button("Gerar documento", type="primary"):
-        cfg = JobConfig(title=title, placeholders=inputs)
-
-        doc = Document(io.BytesIO(template_bytes))
-        exceptions = replace_doc(doc, cfg.placeholders)
-        format_doc(doc, exceptions)
+        cfg = JobConfig(title=title, placeholders=normalize_mapping(inputs))
 
-        docx_buffer = io.BytesIO()
-        doc.save(docx_buffer)
-        docx_bytes = docx_buffer.getvalue()
+        # Mesmo caminho do lote: o template fica aberto no processo (cache do
+        # mourender, que sobrevive aos reruns) e cada geração usa uma cópia
+        _, docx_bytes, _ = render_one(template_bytes, cfg.placeholders, cfg.title, tuple(fields), with_pdf=False)
 
         st.success("Documento gerado!")
 
@@ -295,44 +182,80 @@ else:
         if missing_cols:
             st.warning("Colunas ausentes no XLSX: " + ", ".join(missing_cols))
 
-        zip_buffer = io.BytesIO()
-
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as z:
-            for idx, row in df.iterrows():
-                data = {
-                    field: "" if pd.isna(row.get(field, "")) else str(row.get(field, ""))
-                    for field in fields
-                }
+        keys = tuple(fields)
 
-                title = row.get("TITLE", "")
-                if pd.isna(title) or str(title).strip() == "":
-                    title = f"MOU – {data.get('FANTASY_NAME', data.get('GROUP_NAME', 'Documento'))}"
+        # Conversão para texto feita uma vez, por coluna; as linhas saem dos
+        # vetores de coluna já convertidos, sem Series nem pd.isna/str por célula
+        columns = list(dict.fromkeys(fields + ["TITLE"]))
+        text_df = df.reindex(columns=columns).astype(object).fillna("").astype(str)
+        field_values = zip(*(text_df[field].tolist() for field in fields))
+        titles = text_df["TITLE"].tolist()
 
-                title = str(title).strip()
+        jobs = []
+        for values, title in zip(field_values, titles):
+            data = dict(zip(fields, values))
 
-                doc = Document(io.BytesIO(template_bytes))
-                exceptions = replace_doc(doc, data)
-                format_doc(doc, exceptions)
+            title = title.strip()
+            if not title:
+                title = f"MOU – {data.get('FANTASY_NAME', data.get('GROUP_NAME', 'Documento'))}".strip()
 
-                docx_buffer = io.BytesIO()
-                doc.save(docx_buffer)
-                docx_bytes = docx_buffer.getvalue()
+            jobs.append((data, title))
 
-                z.writestr(f"{title}.docx", docx_bytes)
-
-                pdf_bytes = convert_pdf(docx_bytes)
-                if pdf_bytes:
-                    z.writestr(f"{title}.pdf", pdf_bytes)
-
-        zip_buffer.seek(0)
-
-        st.success("Lote gerado!")
-        st.download_button(
-            "⬇️ Baixar ZIP",
-            data=zip_buffer,
-            file_name="mous_gerados.zip",
-            mime="application/zip",
-        )
+        # ZIP gravado em arquivo temporário em vez de ficar inteiro na memória
+        with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as tmp:
+            zip_path = tmp.name
+        try:
+            # DOCX e PDF já são comprimidos: guardar sem deflate poupa CPU sem aumentar o ZIP
+            with tempfile.TemporaryDirectory() as td, zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as z:
+                # Linhas independentes: cada DOCX é gerado num processo; o template
+                # vai para cada processo uma vez só, pelo initializer
+                docx_paths = {}
+                # Com "spawn", os processos sobem a cada submit: é aí que o
+                # __file__ precisa estar oculto
+                with ProcessPoolExecutor(
+                    max_workers=render_workers(len(jobs)),
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_worker,
+                    initargs=(template_bytes, keys),
+                ) as pool:
+                    with main_file_hidden():
+                        futures = {
+                            pool.submit(render_row, data, title): i
+                            for i, (data, title) in enumerate(jobs)
+                        }
+                    for future in as_completed(futures):
+                        title, docx_bytes, _ = future.result()
+                        z.writestr(f"{title}.docx", docx_bytes)
+
+                        docx_path = os.path.join(td, f"{futures[future]}.docx")
+                        with open(docx_path, "wb") as f:
+                            f.write(docx_bytes)
+                        docx_paths[docx_path] = title
+
+                # PDFs: um único LibreOffice para o lote todo; o que não converter
+                # volta para a conversão individual
+                pdf_paths = convert_pdfs(list(docx_paths), td)
+                for docx_path, title in docx_paths.items():
+                    if docx_path in pdf_paths:
+                        with open(pdf_paths[docx_path], "rb") as f:
+                            pdf_bytes = f.read()
+                    else:
+                        with open(docx_path, "rb") as f:
+                            pdf_bytes = convert_pdf(f.read())
+                    if pdf_bytes:
+                        z.writestr(f"{title}.pdf", pdf_bytes)
+
+            st.success("Lote gerado!")
+            with open(zip_path, "rb") as zip_file:
+                st.download_button(
+                    "⬇️ Baixar ZIP",
+                    data=zip_file,
+                    file_name="mous_gerados.zip",
+                    mime="application/zip",
+                )
+        finally:
+            # Também em erro, st.stop ou rerun: o ZIP não fica no disco do servidor
+            os.remove(zip_path)
 
 
 with st.expander("Campos encontrados no template"):
@@ -0,0 +1,787 @@
+import copy
+import io
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+import subprocess
+import sys
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+from docx import Document
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+from lxml import etree
+
+PLACEHOLDER_RE = re.compile(r"\{\{([A-Z0-9_]+)\}\}", re.IGNORECASE)
+# Placeholders cujo parágrafo não recebe negrito
+EXCEPTION_PLACEHOLDERS = frozenset({"BP_DATE", "COMMENTS", "COMMENTS_ENG"})
+_WS_RE = re.compile(r"\s+")
+# Trechos que tiram o negrito do parágrafo; uma única alternância classifica
+# o parágrafo numa só varredura, em vez de um teste `in` por trecho
+EXCEPTION_PHRASES = (
+    "como parte integrante deste documento",
+    "as an integral part of this document",
+    "business plan",
+    "arquivo:",
+    "file:",
+    "especifica",
+    "specification",
+)
+# Os placeholders de exceção entram na mesma alternância, como texto literal
+# em minúsculas: uma busca só decide o parágrafo
+_EXCEPTION_TOKENS = EXCEPTION_PHRASES + tuple("{{" + k.lower() + "}}" for k in sorted(EXCEPTION_PLACEHOLDERS))
+EXCEPTION_PHRASES_RE = re.compile("|".join(re.escape(ph) for ph in _EXCEPTION_TOKENS))
+_MIN_PHRASE_LEN = min(map(len, _EXCEPTION_TOKENS))
+# Todo token acima contém um destes trechos: se nenhum aparece no texto (a
+# grande maioria dos parágrafos), a alternância nem precisa rodar.
+# Ao incluir um trecho novo, conferir se ele continua coberto aqui.
+_EXCEPTION_HINTS = (":", "{{", "specific", "integra", "business plan")
+# "n/a", "n / a", "na." etc.: comparado sem espaços, sem regex
+_NA_FORMS = frozenset({"n/a", "na", "n/a.", "na."})
+_DROP_SPACES = str.maketrans("", "", " ")
+# Partes do pacote com texto do documento (corpo, cabeçalhos e rodapés)
+_XML_PART_RE = re.compile(r"^word/(document|header\d*|footer\d*)\.xml$")
+
+# ---------------------------
+# DOCX utils
+# ---------------------------
+def _iter_all_paragraphs(doc: Document):
+    # Uma única iteração do lxml por parte: no corpo, os parágrafos de tabelas
+    # (inclusive aninhadas) já são descendentes de <w:body>
+    body = doc._body
+    for el in doc.element.body.iter(qn("w:p")):
+        yield Paragraph(el, body)
+
+    # Cabeçalho/rodapé sem definição própria (ligado ao anterior) fica de
+    # fora: acessar o _element dele criaria uma parte nova no documento
+    for section in doc.sections:
+        for part in (section.header, section.footer):
+            if part.is_linked_to_previous:
+                continue
+            for el in part._element.iter(qn("w:p")):
+                yield Paragraph(el, part)
+
+
+def _normalize_ws(txt: str) -> str:
+    # Caso comum: texto ASCII sem tabs/quebras/espaços duplos dispensa a regex
+    # (fora do ASCII, \s também pega espaços como o não separável)
+    if txt.isascii() and "  " not in txt and not any(c in txt for c in "\t\n\r\x0b\x0c"):
+        return txt.strip()
+    return _WS_RE.sub(" ", txt).strip()
+
+
+# Mesmo conteúdo que Run.text, para todos os runs diretos do parágrafo numa
+# única consulta compilada, sem montar os wrappers Run
+_RUN_TEXT_XPATH = etree.XPath(
+    "w:r/w:br | w:r/w:cr | w:r/w:noBreakHyphen | w:r/w:ptab | w:r/w:t | w:r/w:tab",
+    namespaces={"w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main"},
+)
+_T = qn("w:t")
+
+
+def _para_text(p) -> str:
+    text = "".join((el.text or "") if el.tag == _T else str(el) for el in _RUN_TEXT_XPATH(p._p))
+    return _normalize_ws(text or p.text or "")
+
+
+def collect_paragraph_texts(doc: Document) -> List[list]:
+    # [parágrafo, texto, texto em minúsculas]: calculado uma vez por geração
+    # e compartilhado entre a substituição e a formatação
+    paragraphs = []
+    for p in _iter_all_paragraphs(doc):
+        text = _para_text(p)
+        paragraphs.append([p, text, text.lower()])
+    return paragraphs
+
+
+def extract_placeholders(doc: Document) -> Set[str]:
+    found = set()
+    for p in _iter_all_paragraphs(doc):
+        for m in PLACEHOLDER_RE.finditer(_para_text(p)):
+            found.add(m.group(1).strip().upper())
+    return found
+
+
+_WT_RE = re.compile(rb"<w:t(?:\s[^>]*)?>([^<]*)</w:t>")
+
+
+def extract_placeholders_fast(template_bytes: bytes) -> Set[str]:
+    # Mesmo resultado do extract_placeholders, lendo o XML das partes direto do
+    # zip: junta os <w:t> de cada parágrafo (placeholder quebrado entre runs
+    # também conta) e roda uma findall, sem abrir o documento no python-docx
+    found = set()
+    with zipfile.ZipFile(io.BytesIO(template_bytes)) as z:
+        for name in z.namelist():
+            if not _XML_PART_RE.match(name):
+                continue
+            for para in z.read(name).split(b"</w:p>"):
+                text = b"".join(_WT_RE.findall(para)).decode("utf-8", "ignore")
+                found.update(m.upper() for m in PLACEHOLDER_RE.findall(text))
+    return found
+
+
+# ---------------------------
+# Exceções de negrito
+# ---------------------------
+def is_exception(t: str) -> bool:
+    # Recebe o texto já normalizado e em minúsculas (o `low` de
+    # collect_paragraph_texts), para não refazer lower()/strip() por parágrafo.
+    # Parágrafos vazios ou de um caractere (comuns no template) saem direto
+    if len(t) < 2:
+        return False
+
+    if (
+        len(t) >= _MIN_PHRASE_LEN
+        and any(hint in t for hint in _EXCEPTION_HINTS)
+        and EXCEPTION_PHRASES_RE.search(t)
+    ):
+        return True
+
+    if len(t) <= 7 and t.translate(_DROP_SPACES) in _NA_FORMS:
+        return True
+
+    return False
+
+
+# ---------------------------
+# Replace placeholders
+# ---------------------------
+@lru_cache(maxsize=32)
+def compile_placeholder_re(keys: Tuple[str, ...]) -> re.Pattern:
+    # Uma única alternância com todos os placeholders: um só autômato percorre o texto.
+    # Compilada uma vez por conjunto de chaves (e por processo), não a cada geração
+    alternatives = sorted((r"\{\{" + re.escape(k) + r"\}\}" for k in keys), key=len, reverse=True)
+    return re.compile("|".join(alternatives) or r"(?!)", re.IGNORECASE)
+
+
+def normalize_mapping(mapping: Dict[str, str]) -> Dict[str, str]:
+    # Valores que já são texto (o caso do lote) dispensam o pd.isna
+    return {
+        k.strip().strip("{} ").upper(): v if type(v) is str else ("" if pd.isna(v) else str(v))
+        for k, v in mapping.items()
+    }
+
+
+def _substituter(values: Dict[str, str], placeholder_re: re.Pattern):
+    # Devolve a função de substituição de um texto. Caso comum: o token aparece
+    # em maiúsculas, como no template, e basta um str.replace por token presente
+    # (tudo em C, sem callback). A regex (case-insensitive) fica para o que
+    # sobrar com "{{". O atalho só vale se nenhum valor trouxer "{{", senão um
+    # replace poderia alcançar texto inserido pelo anterior.
+    table = {"{{" + k.lower() + "}}": v for k, v in values.items()}
+    exact = [("{{" + k + "}}", v) for k, v in values.items()]
+    use_replace = not any("{{" in v for v in values.values())
+
+    def _lookup(m):
+        return table.get(m.group(0).lower(), m.group(0))
+
+    def substitute(text: str) -> str:
+        if use_replace:
+            for token, v in exact:
+                if token in text:
+                    text = text.replace(token, v)
+            if "{{" not in text:
+                return text
+        return placeholder_re.sub(_lookup, text)
+
+    return substitute
+
+
+def replace_doc(paragraphs: List[list], mapping: Dict[str, str], placeholder_re: Optional[re.Pattern] = None,
+                substitute=None):
+    exceptions = set()
+
+    # No lote a substituição já vem montada uma vez por linha (ver render_one)
+    if substitute is None:
+        normalized_mapping = normalize_mapping(mapping)
+        if placeholder_re is None:
+            placeholder_re = compile_placeholder_re(tuple(normalized_mapping))
+        substitute = _substituter(normalized_mapping, placeholder_re)
+
+    for entry in paragraphs:
+        p, original, low = entry
+
+        if is_exception(low):
+            exceptions.add(p)
+
+        # A maioria dos parágrafos não tem placeholder: nem chega à regex
+        if "{{" not in original:
+            continue
+
+        replaced = substitute(original)
+
+        if replaced != original:
+            # Remove os runs direto no XML, sem reconstruir p.runs a cada volta
+            for r in p._element.findall(qn("w:r")):
+                p._element.remove(r)
+            p.add_run(replaced)
+            entry[1] = _normalize_ws(replaced)
+            entry[2] = entry[1].lower()
+
+    return exceptions
+
+
+_XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+_P = qn("w:p")
+
+
+def _split_placeholders(joined: str, t_els, placeholder_re: re.Pattern) -> bool:
+    # True se algum placeholder do parágrafo está quebrado entre <w:t>
+    # (ex.: "{{" num run e "X}}" no seguinte)
+    return len(placeholder_re.findall(joined)) != sum(len(placeholder_re.findall(t.text or "")) for t in t_els)
+
+
+def _set_t_text(t, text: str):
+    # Troca o <w:t> pelo texto, convertendo \n/\t em <w:br/>/<w:tab/> como o
+    # Run.text do python-docx (o mesmo que o add_run do replace_doc faz)
+    if "\n" not in text and "\t" not in text and "\r" not in text:
+        t.text = text
+        if text != text.strip():
+            t.set(_XML_SPACE, "preserve")
+        return
+    scratch = OxmlElement("w:r")
+    scratch.text = text
+    for el in list(scratch):
+        t.addprevious(el)
+    t.getparent().remove(t)
+
+
+def substitute_tree(doc: Document, substitute, placeholder_re: re.Pattern) -> Set:
+    # Substitui os placeholders direto nos <w:t> das partes de texto (corpo,
+    # cabeçalhos e rodapés), preservando a formatação de cada run. Cada <w:t>
+    # passa uma vez só pelo `substitute`: o texto inserido nunca é relido.
+    # Parágrafos com placeholder quebrado entre runs ficam intactos e são
+    # devolvidos (elementos <w:p>) para o replace_doc, que os reescreve a
+    # partir do texto original, também numa passada só.
+    split = set()
+    for part in doc.part.package.iter_parts():
+        if not _XML_PART_RE.match(part.partname.lstrip("/")):
+            continue
+        for p_el in part._element.iter(_P):
+            # Só os <w:t> deste parágrafo; os de parágrafos aninhados (caixas
+            # de texto) ficam para a iteração do próprio parágrafo
+            t_els = [t for t in p_el.iter(_T) if next(t.iterancestors(_P)) is p_el]
+            joined = "".join(t.text or "" for t in t_els)
+            if "{{" not in joined:
+                continue
+            if _split_placeholders(joined, t_els, placeholder_re):
+                split.add(p_el)
+                continue
+            for t in t_els:
+                text = t.text
+                if not text or "{{" not in text:
+                    continue
+                replaced = substitute(text)
+                if replaced != text:
+                    _set_t_text(t, replaced)
+    return split
+
+
+# ---------------------------
+# Formatação
+# ---------------------------
+# Propriedades que vêm dos padrões do template (ver bake_default_formatting)
+_FONT_ATTRS = tuple(qn(a) for a in ("w:ascii", "w:hAnsi", "w:asciiTheme", "w:hAnsiTheme"))
+# Elementos que vêm depois de <w:sz> dentro de <w:rPr> (ordem do schema)
+_AFTER_SZ = tuple(qn(t) for t in (
+    "w:szCs", "w:highlight", "w:u", "w:effect", "w:bdr", "w:shd", "w:fitText", "w:vertAlign",
+    "w:rtl", "w:cs", "w:em", "w:lang", "w:eastAsianLayout", "w:specVanish", "w:oMath",
+))
+
+
+_RFONTS = qn("w:rFonts")
+_DIRECT_TAGS = frozenset({qn("w:sz"), qn("w:b")})
+
+
+def _strip_run_formatting(rPr):
+    # Uma passada pelos filhos do <w:rPr>, sem um find() por propriedade
+    for el in list(rPr):
+        if el.tag == _RFONTS:
+            for attr in _FONT_ATTRS:
+                el.attrib.pop(attr, None)
+            if not el.attrib:
+                rPr.remove(el)
+        elif el.tag in _DIRECT_TAGS:
+            rPr.remove(el)
+
+
+def _child(parent, tag: str, index: int = 0):
+    el = parent.find(qn(tag))
+    if el is None:
+        el = etree.Element(qn(tag))
+        parent.insert(index, el)
+    return el
+
+
+def _bake_styles(styles_xml: bytes) -> bytes:
+    root = etree.fromstring(styles_xml)
+
+    # Estilos não definem fonte/tamanho/negrito: tudo herda dos padrões abaixo
+    for rPr in root.iter(qn("w:rPr")):
+        _strip_run_formatting(rPr)
+
+    doc_defaults = _child(root, "w:docDefaults")
+    rPr = _child(_child(doc_defaults, "w:rPrDefault"), "w:rPr")
+
+    rFonts = _child(rPr, "w:rFonts")
+    rFonts.set(qn("w:ascii"), "Calibri")
+    rFonts.set(qn("w:hAnsi"), "Calibri")
+    rPr.insert(rPr.index(rFonts) + 1, etree.Element(qn("w:b")))
+
+    sz = etree.Element(qn("w:sz"))
+    sz.set(qn("w:val"), "22")  # meios-pontos: 11 pt
+    after = next((el for el in rPr if el.tag in _AFTER_SZ), None)
+    if after is None:
+        rPr.append(sz)
+    else:
+        after.addprevious(sz)
+
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+
+# Partes que o format_doc não percorre por inteiro (cabeçalhos/rodapés de
+# primeira página e pares, notas, comentários). Os padrões novos valeriam
+# também para elas; por isso os runs delas recebem, antes do bake, a fonte,
+# o tamanho e o negrito que tinham. Nos cabeçalhos/rodapés padrão o
+# format_doc remove essa formatação de novo, então fixar em todos é seguro.
+_PIN_PART_RE = re.compile(r"^word/(header\d*|footer\d*|footnotes|endnotes|comments)\.xml$")
+# Marcas de parágrafo (<w:pPr><w:rPr>) nunca são formatadas pelo format_doc:
+# em todas as partes de texto elas recebem o que tinham, o que mantém a
+# altura de parágrafos vazios, a formatação dos números de listas e o texto
+# digitado depois num parágrafo vazio
+_PIN_MARK_RE = re.compile(r"^word/(document|header\d*|footer\d*|footnotes|endnotes|comments)\.xml$")
+_FONT_GROUPS = (
+    ("ascii", (qn("w:ascii"), qn("w:asciiTheme"))),
+    ("hAnsi", (qn("w:hAnsi"), qn("w:hAnsiTheme"))),
+)
+_FALSE_VALS = frozenset({"0", "false", "off"})
+# Elementos que vêm antes de <w:rFonts> e de <w:b> (ordem do schema; as
+# marcas de revisão só aparecem no <w:rPr> da marca de parágrafo)
+_BEFORE_RFONTS = tuple(qn(t) for t in ("w:ins", "w:del", "w:moveFrom", "w:moveTo", "w:rStyle"))
+_BEFORE_B = _BEFORE_RFONTS + (_RFONTS,)
+# Elementos que vêm depois de <w:rPr> dentro de <w:pPr>
+_AFTER_PARA_RPR = tuple(qn(t) for t in ("w:sectPr", "w:pPrChange"))
+_TC = qn("w:tc")
+_TBL = qn("w:tbl")
+_TXBX_CONTENT = qn("w:txbxContent")
+
+
+def _run_props(rPr) -> dict:
+    # Fonte (por grupo ascii/hAnsi), tamanho e negrito definidos num <w:rPr>
+    props = {}
+    if rPr is None:
+        return props
+    rFonts = rPr.find(_RFONTS)
+    if rFonts is not None:
+        for group, attrs in _FONT_GROUPS:
+            values = {a: rFonts.get(a) for a in attrs if rFonts.get(a) is not None}
+            if values:
+                props[group] = values
+    sz = rPr.find(qn("w:sz"))
+    if sz is not None and sz.get(qn("w:val")):
+        props["sz"] = sz.get(qn("w:val"))
+    b = rPr.find(qn("w:b"))
+    if b is not None:
+        props["b"] = (b.get(qn("w:val")) or "1").lower() not in _FALSE_VALS
+    return props
+
+
+def _style_resolver(styles_root):
+    # Propriedades efetivas de um estilo, seguindo a cadeia basedOn (o negrito
+    # é tratado como "o mais próximo vence", sem a alternância de toggle)
+    styles = {style.get(qn("w:styleId")): style for style in styles_root.iter(qn("w:style"))}
+    cache = {}
+
+    def resolve(style_id, seen=()):
+        if style_id is None or style_id not in styles or style_id in seen:
+            return {}
+        if style_id not in cache:
+            style = styles[style_id]
+            based = style.find(qn("w:basedOn"))
+            props = dict(resolve(based.get(qn("w:val")) if based is not None else None, seen + (style_id,)))
+            props.update(_run_props(style.find(qn("w:rPr"))))
+            cache[style_id] = props
+        return cache[style_id]
+
+    defaults = _run_props(styles_root.find(qn("w:docDefaults") + "/" + qn("w:rPrDefault") + "/" + qn("w:rPr")))
+    # Sem nada definido, o Word usa Times New Roman 10, sem negrito
+    for group, (attr, _) in _FONT_GROUPS:
+        defaults.setdefault(group, {attr: "Times New Roman"})
+    defaults.setdefault("sz", "20")
+    defaults.setdefault("b", False)
+
+    def default_style(style_type):
+        return next(
+            (style_id for style_id, style in styles.items()
+             if style.get(qn("w:type")) == style_type and style.get(qn("w:default")) in ("1", "true")),
+            None,
+        )
+
+    return resolve, defaults, default_style("paragraph"), default_style("table")
+
+
+def _paragraph_props(p, resolver) -> dict:
+    # Propriedades herdadas por um run do parágrafo: padrões do documento,
+    # estilo da tabela (se o parágrafo está numa célula) e estilo do parágrafo.
+    # Como no Word, o estilo de parágrafo padrão não passa por cima do estilo
+    # da tabela. A formatação condicional da tabela (tblStylePr, ex.: primeira
+    # linha) fica de fora
+    resolve, defaults, default_para, default_table = resolver
+    p_style = p.find(qn("w:pPr") + "/" + qn("w:pStyle"))
+    p_style_id = p_style.get(qn("w:val")) if p_style is not None else default_para
+
+    table_props = {}
+    container = next(p.iterancestors(_TC, _TXBX_CONTENT), None)
+    if container is not None and container.tag == _TC:
+        tbl = next(container.iterancestors(_TBL))
+        tbl_style = tbl.find(qn("w:tblPr") + "/" + qn("w:tblStyle"))
+        table_props = resolve(tbl_style.get(qn("w:val")) if tbl_style is not None else default_table)
+
+    props = dict(defaults)
+    if p_style_id == default_para:
+        props.update(resolve(p_style_id))
+        props.update(table_props)
+    else:
+        props.update(table_props)
+        props.update(resolve(p_style_id))
+    return props
+
+
+def _insert_after(parent, el, before_tags):
+    before = [child for child in parent if child.tag in before_tags]
+    parent.insert(parent.index(before[-1]) + 1 if before else 0, el)
+
+
+def _pin_run_props(rPr, props: dict):
+    # Grava no <w:rPr> as propriedades que ele não define, na ordem do schema
+    if "ascii" in props or "hAnsi" in props:
+        rFonts = rPr.find(_RFONTS)
+        if rFonts is None:
+            rFonts = etree.Element(_RFONTS)
+            _insert_after(rPr, rFonts, _BEFORE_RFONTS)
+        for group, _ in _FONT_GROUPS:
+            for attr, value in props.get(group, {}).items():
+                rFonts.set(attr, value)
+    if "b" in props:
+        b = etree.Element(qn("w:b"))
+        if not props["b"]:
+            b.set(qn("w:val"), "0")
+        _insert_after(rPr, b, _BEFORE_B)
+    if "sz" in props:
+        sz = etree.Element(qn("w:sz"))
+        sz.set(qn("w:val"), props["sz"])
+        after = next((el for el in rPr if el.tag in _AFTER_SZ), None)
+        if after is None:
+            rPr.append(sz)
+        else:
+            after.addprevious(sz)
+
+
+def _pin_missing(rPr, effective: dict):
+    # Fixa no <w:rPr> o que ele herdaria e não define; devolve None se não
+    # há nada a fixar e o rPr ainda não existe
+    direct = _run_props(rPr)
+    missing = {k: v for k, v in effective.items() if k not in direct}
+    if not missing:
+        return rPr
+    if rPr is None:
+        rPr = etree.Element(qn("w:rPr"))
+    _pin_run_props(rPr, missing)
+    return rPr
+
+
+def _pin_part_formatting(part_xml: bytes, resolver, runs: bool = True) -> bytes:
+    resolve = resolver[0]
+    root = etree.fromstring(part_xml)
+    for p in root.iter(qn("w:p")):
+        pPr = p.find(qn("w:pPr"))
+        para_props = _paragraph_props(p, resolver)
+
+        # Marca de parágrafo: mesma herança de um run do parágrafo
+        mark_rPr = pPr.find(qn("w:rPr")) if pPr is not None else None
+        r_style = mark_rPr.find(qn("w:rStyle")) if mark_rPr is not None else None
+        effective = dict(para_props)
+        if r_style is not None:
+            effective.update(resolve(r_style.get(qn("w:val"))))
+        pinned = _pin_missing(mark_rPr, effective)
+        if pinned is not None and mark_rPr is None:
+            if pPr is None:
+                pPr = etree.Element(qn("w:pPr"))
+                p.insert(0, pPr)
+            after = next((el for el in pPr if el.tag in _AFTER_PARA_RPR), None)
+            if after is None:
+                pPr.append(pinned)
+            else:
+                after.addprevious(pinned)
+
+        if not runs:
+            continue
+        # Só os runs deste parágrafo; os de parágrafos aninhados (caixas de
+        # texto) ficam para a iteração do próprio parágrafo
+        for r in p.iter(qn("w:r")):
+            if next(r.iterancestors(qn("w:p"))) is not p:
+                continue
+            rPr = r.find(qn("w:rPr"))
+            r_style = rPr.find(qn("w:rStyle")) if rPr is not None else None
+            effective = dict(para_props)
+            if r_style is not None:
+                effective.update(resolve(r_style.get(qn("w:val"))))
+            pinned = _pin_missing(rPr, effective)
+            if pinned is not None and rPr is None:
+                r.insert(0, pinned)
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+
+def _pin_numbering(numbering_xml: bytes, resolver) -> bytes:
+    # Níveis de lista ligados a um estilo de parágrafo (<w:lvl><w:pStyle>)
+    # recebem a fonte, o tamanho e o negrito desse estilo. Nos demais níveis
+    # o número herda da marca do parágrafo, já fixada por _pin_part_formatting;
+    # um valor único no nível passaria por cima do estilo de cada parágrafo
+    resolve, defaults = resolver[:2]
+    root = etree.fromstring(numbering_xml)
+    for lvl in root.iter(qn("w:lvl")):
+        p_style = lvl.find(qn("w:pStyle"))
+        if p_style is None:
+            continue
+        effective = dict(defaults)
+        effective.update(resolve(p_style.get(qn("w:val"))))
+        rPr = lvl.find(qn("w:rPr"))
+        pinned = _pin_missing(rPr, effective)
+        if pinned is not None and rPr is None:
+            lvl.append(pinned)  # <w:rPr> é o último filho de <w:lvl>
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+
+def bake_default_formatting(template_bytes: bytes) -> bytes:
+    # Calibri 11 + negrito passam a ser o padrão do documento (docDefaults),
+    # em vez de serem gravados run a run em cada geração. Os estilos perdem
+    # fonte/tamanho/negrito; o que o format_doc não formata (partes que ele
+    # não percorre, marcas de parágrafo e números de lista) recebe antes as
+    # propriedades que tinha. Diferença que resta: quem editar o DOCX gerado
+    # e aplicar um estilo (ex.: Título 1) ou criar um parágrafo com ele terá
+    # Calibri 11 negrito em vez da fonte/tamanho originais do estilo
+    out = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(template_bytes)) as zin, zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zout:
+        names = set(zin.namelist())
+        resolver = None
+        if "word/styles.xml" in names:
+            resolver = _style_resolver(etree.fromstring(zin.read("word/styles.xml")))
+        for item in zin.infolist():
+            data = zin.read(item)
+            if item.filename == "word/styles.xml":
+                data = _bake_styles(data)
+            elif resolver is not None and item.filename == "word/numbering.xml":
+                data = _pin_numbering(data, resolver)
+            elif resolver is not None and _PIN_MARK_RE.match(item.filename):
+                runs = _PIN_PART_RE.match(item.filename) is not None
+                data = _pin_part_formatting(data, resolver, runs=runs)
+            zout.writestr(item, data)
+    return out.getvalue()
+
+
+_R = qn("w:r")
+
+
+def _paragraph_runs(p_el) -> list:
+    # Todos os runs do parágrafo, inclusive dentro de w:hyperlink, w:ins,
+    # w:sdt, w:fldSimple...; os de parágrafos aninhados (caixas de texto)
+    # ficam para a iteração do próprio parágrafo
+    runs = list(p_el.iter(_R))
+    if not runs or next(p_el.iterdescendants(_P), None) is None:
+        return runs
+    return [r for r in runs if next(r.iterancestors(_P)) is p_el]
+
+
+def format_doc(paragraphs: List[list], exceptions: Set):
+    # Com o template preparado por bake_default_formatting, só é preciso remover
+    # formatação direta que contrarie o padrão e tirar o negrito das exceções.
+    # O "2." separado da frase também fica sem negrito; a frase seguinte,
+    # se for exceção, é detectada na sua própria iteração.
+    for p, _, low in paragraphs:
+        # Direto nos <w:r>, sem criar os wrappers Run/Font a cada run.
+        # Parágrafos sem runs (espaçadores, quebras de seção) não têm o que formatar
+        runs = _paragraph_runs(p._p)
+        if not runs:
+            continue
+
+        is_exc = p in exceptions or low in ("2.", "2") or is_exception(low)
+
+        for r in runs:
+            rPr = r.rPr
+            if rPr is not None:
+                _strip_run_formatting(rPr)
+            if is_exc:
+                r.get_or_add_rPr()._set_bool_val("b", False)
+
+
+# ---------------------------
+# PDF
+# ---------------------------
+@lru_cache(maxsize=None)
+def _docx2pdf():
+    # docx2pdf depende do Word: só existe no Windows/macOS. A sondagem é feita
+    # uma vez por processo, em vez de um import + exceção por documento
+    if sys.platform not in ("win32", "darwin"):
+        return None
+    try:
+        from docx2pdf import convert
+    except Exception:
+        return None
+    return convert
+
+
+@lru_cache(maxsize=None)
+def _soffice() -> Optional[str]:
+    return shutil.which("soffice")
+
+
+# Prazo do LibreOffice: partida mais um tanto por documento do lote
+SOFFICE_TIMEOUT = 60
+SOFFICE_TIMEOUT_PER_DOC = 10
+
+
+def convert_pdf(docx_bytes: bytes):
+    docx2pdf_convert = _docx2pdf()
+    if docx2pdf_convert is None and _soffice() is None:
+        return None
+
+    with tempfile.TemporaryDirectory() as td:
+        docx_path = os.path.join(td, "file.docx")
+        pdf_path = os.path.join(td, "file.pdf")
+
+        with open(docx_path, "wb") as f:
+            f.write(docx_bytes)
+
+        if docx2pdf_convert is not None:
+            try:
+                docx2pdf_convert(docx_path, pdf_path)
+                with open(pdf_path, "rb") as f:
+                    return f.read()
+            except Exception:
+                pass
+
+        if docx_path not in convert_pdfs([docx_path], td):
+            return None
+        with open(pdf_path, "rb") as f:
+            return f.read()
+
+
+def convert_pdfs(docx_paths: List[str], outdir: str) -> Dict[str, str]:
+    # Um único processo do LibreOffice converte o lote inteiro; devolve
+    # {caminho do docx: caminho do pdf} apenas para os que foram convertidos.
+    # Perfil próprio por chamada: sem ele, um LibreOffice já aberto (de outra
+    # sessão) recebe o pedido e a chamada termina sem converter nada
+    soffice = _soffice()
+    if not docx_paths or soffice is None:
+        return {}
+
+    with tempfile.TemporaryDirectory() as profile:
+        try:
+            subprocess.run(
+                [
+                    soffice,
+                    f"-env:UserInstallation={Path(profile).as_uri()}",
+                    "--headless",
+                    "--convert-to",
+                    "pdf",
+                    "--outdir",
+                    outdir,
+                    *docx_paths,
+                ],
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                timeout=SOFFICE_TIMEOUT + SOFFICE_TIMEOUT_PER_DOC * len(docx_paths),
+            )
+        except Exception:
+            return {}
+
+    converted = {}
+    for docx_path in docx_paths:
+        name = os.path.splitext(os.path.basename(docx_path))[0]
+        pdf_path = os.path.join(outdir, name + ".pdf")
+        if os.path.exists(pdf_path):
+            converted[docx_path] = pdf_path
+    return converted
+
+
+# ---------------------------
+# Geração de um documento
+# ---------------------------
+@lru_cache(maxsize=2)
+def _parsed_template(template_bytes: bytes) -> Document:
+    # Template aberto uma vez por processo; cada geração trabalha numa cópia
+    # (deepcopy da árvore já montada sai mais barato que descompactar e
+    # reparsear o pacote a cada linha). Nunca é alterado diretamente.
+    return Document(io.BytesIO(template_bytes))
+
+
+@lru_cache(maxsize=8)
+def _template_scan(template_bytes: bytes) -> Tuple[Tuple[Tuple[str, str], ...], frozenset, Tuple[int, ...]]:
+    # Varredura do template feita uma vez: texto de cada parágrafo, exceções
+    # que dependem do texto original (ex.: {{COMMENTS}}) e os parágrafos com
+    # "{{". A substituição nos <w:t> não muda a quantidade nem a ordem dos
+    # parágrafos, e só os que têm placeholder mudam de texto.
+    paragraphs = collect_paragraph_texts(_parsed_template(template_bytes))
+    texts = tuple((text, low) for _, text, low in paragraphs)
+    exception_indexes = frozenset(i for i, (_, low) in enumerate(texts) if is_exception(low))
+    placeholder_indexes = tuple(i for i, (text, _) in enumerate(texts) if "{{" in text)
+    return texts, exception_indexes, placeholder_indexes
+
+
+def render_one(template_bytes: bytes, mapping: Dict[str, str], title: str,
+               keys: Tuple[str, ...], with_pdf: bool = True) -> Tuple[str, bytes, Optional[bytes]]:
+    # Função de nível de módulo (importável) para rodar em ProcessPoolExecutor
+    placeholder_re = compile_placeholder_re(keys)
+    texts, exception_indexes, placeholder_indexes = _template_scan(template_bytes)
+    doc = copy.deepcopy(_parsed_template(template_bytes))
+
+    # Valores normalizados e função de substituição montados uma vez por linha
+    # e compartilhados pelas duas etapas. Cada parágrafo passa por uma delas
+    # só, para que o texto inserido nunca seja substituído de novo
+    values = normalize_mapping(mapping)
+    substitute = _substituter(values, placeholder_re)
+    split = substitute_tree(doc, substitute, placeholder_re)
+
+    # Texto do template reaproveitado; só os parágrafos com placeholder são
+    # relidos, e só os com placeholder quebrado entre runs vão ao replace_doc
+    paragraphs = [[p, text, low] for p, (text, low) in zip(_iter_all_paragraphs(doc), texts)]
+    with_split = []
+    for i in placeholder_indexes:
+        entry = paragraphs[i]
+        entry[1] = _para_text(entry[0])
+        entry[2] = entry[1].lower()
+        if entry[0]._p in split:
+            with_split.append(entry)
+
+    exceptions = {paragraphs[i][0] for i in exception_indexes}
+    exceptions |= replace_doc(with_split, values, placeholder_re, substitute)
+    format_doc(paragraphs, exceptions)
+
+    docx_buffer = io.BytesIO()
+    doc.save(docx_buffer)
+    docx_bytes = docx_buffer.getvalue()
+
+    return title, docx_bytes, convert_pdf(docx_bytes) if with_pdf else None
+
+
+# Template e chaves do lote, enviados uma vez por processo pelo initializer do
+# pool em vez de serializados a cada tarefa
+_worker_template: Optional[bytes] = None
+_worker_keys: Tuple[str, ...] = ()
+
+
+def init_worker(template_bytes: bytes, keys: Tuple[str, ...]):
+    global _worker_template, _worker_keys
+    _worker_template = template_bytes
+    _worker_keys = keys
+
+
+def render_row(mapping: Dict[str, str], title: str, with_pdf: bool = False) -> Tuple[str, bytes, Optional[bytes]]:
+    return render_one(_worker_template, mapping, title, _worker_keys, with_pdf=with_pdf)
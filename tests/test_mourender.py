@@ -0,0 +1,138 @@
+import io
+import os
+import sys
+import zipfile
+
+import pytest
+from docx import Document
+from docx.oxml.ns import qn
+from docx.shared import Pt
+from lxml import etree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mourender import _parsed_template, bake_default_formatting, render_one  # noqa: E402
+
+
+# ---------------------------
+# Fixture
+# ---------------------------
+def _template() -> bytes:
+    doc = Document()
+    doc.styles["Normal"].font.name = "Arial"
+    doc.styles["Table Grid"].font.size = Pt(8)
+
+    doc.add_paragraph("Título {{FANTASY_NAME}}", style="Heading 1")
+    doc.add_paragraph("", style="Heading 1")
+    doc.add_paragraph("Item", style="List Number")
+
+    table = doc.add_table(rows=1, cols=2)
+    table.style = doc.styles["Table Grid"]
+    table.cell(0, 0).text = "{{CNPJ}}"
+
+    section = doc.sections[0]
+    section.different_first_page_header_footer = True
+    section.first_page_header.paragraphs[0].text = "Primeira página"
+
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+@pytest.fixture(scope="module")
+def baked():
+    with zipfile.ZipFile(io.BytesIO(bake_default_formatting(_template()))) as z:
+        return {name: etree.fromstring(z.read(name)) for name in z.namelist() if name.endswith(".xml")}
+
+
+def _mark(p):
+    return p.find(qn("w:pPr") + "/" + qn("w:rPr"))
+
+
+def _sz(rPr):
+    return rPr.find(qn("w:sz")).get(qn("w:val"))
+
+
+def _bold(rPr):
+    b = rPr.find(qn("w:b"))
+    return b is not None and b.get(qn("w:val")) not in ("0", "false", "off")
+
+
+def _body_paragraphs(baked):
+    return list(baked["word/document.xml"].find(qn("w:body")).iter(qn("w:p")))
+
+
+# ---------------------------
+# Testes
+# ---------------------------
+def test_defaults_are_calibri_11_bold_and_styles_are_stripped(baked):
+    styles = baked["word/styles.xml"]
+    rPr = styles.find(qn("w:docDefaults") + "/" + qn("w:rPrDefault") + "/" + qn("w:rPr"))
+    assert rPr.find(qn("w:rFonts")).get(qn("w:ascii")) == "Calibri"
+    assert _sz(rPr) == "22"
+    assert _bold(rPr)
+
+    for style in styles.iter(qn("w:style")):
+        style_rPr = style.find(qn("w:rPr"))
+        if style_rPr is not None:
+            assert style_rPr.find(qn("w:sz")) is None
+            assert style_rPr.find(qn("w:b")) is None
+
+
+def test_empty_spacer_keeps_its_style_size(baked):
+    spacer = _body_paragraphs(baked)[1]
+    assert _sz(_mark(spacer)) == "28"  # Heading 1: 14 pt
+    assert _bold(_mark(spacer))
+
+
+def test_list_paragraph_mark_keeps_normal_formatting(baked):
+    item = _body_paragraphs(baked)[2]
+    mark = _mark(item)
+    assert mark.find(qn("w:rFonts")).get(qn("w:ascii")) == "Arial"
+    assert not _bold(mark)
+
+
+def test_table_cell_mark_takes_the_table_style(baked):
+    cell = baked["word/document.xml"].find(".//" + qn("w:tc"))
+    p = cell.find(qn("w:p"))
+    assert _sz(_mark(p)) == "16"
+
+
+def test_mark_rPr_comes_before_sectPr(baked):
+    for p in _body_paragraphs(baked):
+        pPr = p.find(qn("w:pPr"))
+        tags = [el.tag for el in pPr]
+        if qn("w:sectPr") in tags:
+            assert tags.index(qn("w:rPr")) < tags.index(qn("w:sectPr"))
+
+
+def test_first_page_header_run_is_pinned(baked):
+    header = next(
+        root for name, root in baked.items()
+        if name.startswith("word/header") and "Primeira" in "".join(root.itertext())
+    )
+    rPr = header.find(".//" + qn("w:r") + "/" + qn("w:rPr"))
+    assert rPr.find(qn("w:rFonts")).get(qn("w:ascii")) == "Arial"
+    assert not _bold(rPr)
+
+
+def test_style_linked_numbering_level_is_pinned(baked):
+    levels = [lvl for lvl in baked["word/numbering.xml"].iter(qn("w:lvl")) if lvl.find(qn("w:pStyle")) is not None]
+    assert levels
+    for lvl in levels:
+        rPr = lvl.find(qn("w:rPr"))
+        assert rPr is not None and rPr.find(qn("w:sz")) is not None
+
+
+def test_render_leaves_the_cached_template_untouched():
+    doc = Document()
+    doc.add_paragraph("{{FANTASY_NAME}}")
+    buf = io.BytesIO()
+    doc.save(buf)
+    template = bake_default_formatting(buf.getvalue())
+
+    parts = {str(part.partname) for part in _parsed_template(template).part.package.iter_parts()}
+    _, docx_bytes, _ = render_one(template, {"FANTASY_NAME": "ACME"}, "t", ("FANTASY_NAME",), with_pdf=False)
+
+    assert {str(part.partname) for part in _parsed_template(template).part.package.iter_parts()} == parts
+    assert Document(io.BytesIO(docx_bytes)).paragraphs[0].text == "ACME"